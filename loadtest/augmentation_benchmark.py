@@ -0,0 +1,73 @@
+"""Throughput benchmark for the on-the-fly augmentation pipeline in src/model.py
+
+Measures, on synthetic mel-spectrograms of the training shape:
+  1. input pipeline alone (augmentation only, no model)
+  2. training without augmentation
+  3. training with augmentation
+If (1) is much faster than (2) and (3) is close to (2), augmentation is not
+starving the model.
+
+Usage (example):
+python -m loadtest.augmentation_benchmark --samples 2048 --batch_size 32
+"""
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from src.model import build_model, make_augment_fn, make_dataset
+
+
+def samples_per_second(ds, n_samples, epochs):
+    # first pass warms up tracing and the prefetch buffer
+    for _ in ds.take(2):
+        pass
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for _ in ds:
+            pass
+    return n_samples * epochs / (time.perf_counter() - start)
+
+
+def training_samples_per_second(ds, input_shape, num_classes, one_hot, n_samples, epochs):
+    model = build_model(input_shape, num_classes, one_hot_labels=one_hot)
+    model.fit(ds, epochs=1, verbose=0)
+    start = time.perf_counter()
+    model.fit(ds, epochs=epochs, verbose=0)
+    return n_samples * epochs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=2048)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--n_mels', type=int, default=128)
+    parser.add_argument('--frames', type=int, default=173)
+    parser.add_argument('--num_classes', type=int, default=10)
+    parser.add_argument('--epochs', type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.random((args.samples, args.n_mels, args.frames), dtype=np.float32)
+    y = rng.integers(0, args.num_classes, args.samples)
+    input_shape = X.shape[1:]
+    augment_fn = make_augment_fn(args.num_classes)
+
+    aug_ds = make_dataset(X, y, args.batch_size, shuffle=True, augment_fn=augment_fn)
+    plain_ds = make_dataset(X, y, args.batch_size, shuffle=True)
+
+    pipeline = samples_per_second(aug_ds, args.samples, args.epochs)
+    plain = training_samples_per_second(plain_ds, input_shape, args.num_classes, False,
+                                        args.samples, args.epochs)
+    augmented = training_samples_per_second(aug_ds, input_shape, args.num_classes, True,
+                                            args.samples, args.epochs)
+
+    print(f'Augmentation pipeline only: {pipeline:10.1f} samples/s')
+    print(f'Training, no augmentation:  {plain:10.1f} samples/s')
+    print(f'Training, augmentation:     {augmented:10.1f} samples/s')
+    print(f'Pipeline headroom over training: {pipeline / plain:.1f}x')
+    print(f'Training slowdown from augmentation: {(1 - augmented / plain) * 100:.1f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Measure API server memory per request under concurrent large uploads
+
+Start the API first (e.g. `uvicorn src.prediction:app --port 8000`) and pass
+its process id. The script posts `--concurrency` large WAV uploads at once,
+samples the server's resident memory from /proc (Linux only) while they run,
+and reports the peak growth per in-flight request. It also checks that an
+over-limit upload is rejected both from its Content-Length header and, when
+sent chunked without one, while the body is streaming in, and that a
+non-audio upload is rejected before decoding.
+
+Usage (example):
+python -m loadtest.upload_memory_benchmark --pid 12345 --concurrency 16 --seconds 45
+"""
+import io
+import time
+import wave
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+
+def make_wav(seconds, sr=44100, channels=2):
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(int(seconds * sr) * channels) * 3000).astype(np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def rss_bytes(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, rss_bytes(self.pid))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def post(url, name, payload, content_type='audio/wav'):
+    start = time.perf_counter()
+    resp = requests.post(f'{url}/predict', files={'file': (name, payload, content_type)},
+                         timeout=300)
+    return resp.status_code, time.perf_counter() - start
+
+
+def chunked_multipart(name, total_bytes, boundary, chunk_size=2**20):
+    """Yield a multipart body piece by piece so requests sends it chunked, with no Content-Length."""
+    yield (f'--{boundary}\r\n'
+           f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+           'Content-Type: audio/wav\r\n\r\n').encode()
+    chunk = b'\0' * chunk_size
+    sent = 0
+    while sent < total_bytes:
+        piece = chunk[:total_bytes - sent]
+        sent += len(piece)
+        yield piece
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+def post_chunked(url, name, total_bytes):
+    boundary = 'benchmark-boundary'
+    start = time.perf_counter()
+    resp = requests.post(f'{url}/predict', data=chunked_multipart(name, total_bytes, boundary),
+                         headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                         timeout=300)
+    return resp.status_code, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--pid', type=int, required=True)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=45.0,
+                        help='length of each uploaded WAV (44.1 kHz stereo); keep under MAX_UPLOAD_BYTES')
+    parser.add_argument('--oversize_mb', type=float, default=64.0)
+    args = parser.parse_args()
+
+    payload = make_wav(args.seconds)
+    print(f'Upload size: {len(payload) / 2**20:.1f} MiB x {args.concurrency} concurrent')
+
+    # warm up so model/graph allocations are not counted as per-request memory
+    print('Warm-up:', post(args.url, 'warmup.wav', make_wav(1.0)))
+    baseline = rss_bytes(args.pid)
+
+    sampler = RssSampler(args.pid)
+    sampler.start()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda i: post(args.url, f'large{i}.wav', payload),
+                                range(args.concurrency)))
+    sampler.stop()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(t for _, t in results)
+    growth = max(0, sampler.peak - baseline)
+    print(f'Statuses: {statuses}')
+    print(f'Latency p50 {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s')
+    print(f'Server RSS baseline {baseline / 2**20:.1f} MiB, peak {sampler.peak / 2**20:.1f} MiB')
+    print(f'Peak growth per in-flight request: {growth / args.concurrency / 2**20:.2f} MiB')
+
+    oversize_bytes = int(args.oversize_mb * 2**20)
+    # the server may answer 413 and close before the client finishes sending
+    try:
+        status, elapsed = post(args.url, 'huge.wav', b'\0' * oversize_bytes)
+        print(f'Oversized upload with Content-Length ({args.oversize_mb:.0f} MiB): '
+              f'HTTP {status} in {elapsed:.2f}s')
+    except requests.ConnectionError:
+        print(f'Oversized upload with Content-Length ({args.oversize_mb:.0f} MiB): '
+              'connection closed by server')
+    try:
+        status, elapsed = post_chunked(args.url, 'huge.wav', oversize_bytes)
+        print(f'Oversized chunked upload ({args.oversize_mb:.0f} MiB): '
+              f'HTTP {status} in {elapsed:.2f}s')
+    except requests.ConnectionError:
+        print(f'Oversized chunked upload ({args.oversize_mb:.0f} MiB): '
+              'connection closed by server')
+    status, elapsed = post(args.url, 'notes.txt', b'this is not audio' * 100, 'text/plain')
+    print(f'Non-audio upload: HTTP {status} in {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
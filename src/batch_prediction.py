@@ -0,0 +1,178 @@
+"""Offline bulk scoring of audio archives on disk
+
+Discovers audio files under a root folder, extracts mel-spectrograms in a
+process pool and classifies them in large batches, appending one JSON line
+per file to the output. The output doubles as the checkpoint: rerunning the
+same command skips files already scored and retries files that failed, so a
+file may have earlier error rows followed by its prediction. `--shard i --num_shards n` splits
+the archive across machines by a stable hash of each file's relative path.
+
+Usage (example):
+python -m src.batch_prediction --root data/archive --out results/shard0.jsonl --shard 0 --num_shards 4
+"""
+import os
+import json
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.aiff', '.aif')
+
+
+def list_audio_files(root_dir):
+    """Walk `root_dir` recursively and return sorted audio paths relative to it."""
+    root = Path(root_dir)
+    if not root.exists():
+        raise FileNotFoundError(f'Root directory not found: {root}')
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                paths.append(Path(dirpath, name).relative_to(root).as_posix())
+    return paths
+
+
+def shard_of(rel_path, num_shards):
+    """Map a path onto [0, num_shards) by splitting the 32-bit hash range evenly."""
+    h = int(hashlib.md5(rel_path.encode('utf-8')).hexdigest()[:8], 16)
+    return h * num_shards >> 32
+
+
+def load_checkpoint(out_path):
+    """Return the set of paths with a prediction in `out_path`.
+
+    Error rows do not count as done, so transient read failures are retried.
+
+    A partially written last line (from a killed run) is truncated away so
+    appending can continue cleanly.
+    """
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    good_bytes = 0
+    with open(out_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                row = json.loads(line)
+                path = row['path']
+            except (ValueError, KeyError):
+                break
+            if 'prediction' in row:
+                done.add(path)
+            good_bytes += len(line)
+    if good_bytes < os.path.getsize(out_path):
+        with open(out_path, 'r+b') as f:
+            f.truncate(good_bytes)
+    return done
+
+
+def _extract_chunk(root_dir, rel_paths, n_mels, duration):
+    # runs in worker processes, which never import TensorFlow
+    from src.preprocessing import extract_mel
+    out = []
+    for rel in rel_paths:
+        try:
+            mel = extract_mel(os.path.join(root_dir, rel), n_mels=n_mels, duration=duration)
+            out.append((rel, mel, None))
+        except Exception as e:
+            out.append((rel, None, str(e)))
+    return out
+
+
+def iter_features(root_dir, rel_paths, workers, chunksize, n_mels, duration):
+    """Yield (path, mel, error) in input order, keeping a bounded number of chunks in flight."""
+    max_pending = workers * 4
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        for i in range(0, len(rel_paths), chunksize):
+            pending.append(pool.submit(_extract_chunk, root_dir, rel_paths[i:i + chunksize],
+                                       n_mels, duration))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _flush(model, classes, batch, out_file):
+    rows = []
+    ok = [(path, mel) for path, mel, err in batch if err is None]
+    if ok:
+        probs = model.predict(np.stack([mel for _, mel in ok]), batch_size=len(ok), verbose=0)
+        for (path, _), p in zip(ok, probs):
+            idx = int(np.argmax(p))
+            rows.append({'path': path, 'prediction': classes[idx],
+                         'confidence': float(p[idx]), 'probs': p.tolist()})
+    rows.extend({'path': path, 'error': err} for path, _, err in batch if err is not None)
+    out_file.write(''.join(json.dumps(r) + '\n' for r in rows))
+    out_file.flush()
+    os.fsync(out_file.fileno())
+
+
+def score_archive(root_dir, out_path, model_path='models/us8k_cnn.h5',
+                  classes_path='models/classes.joblib', shard=0, num_shards=1,
+                  batch_size=512, workers=None, chunksize=32, n_mels=128, duration=4.0):
+    if not 0 <= shard < num_shards:
+        raise ValueError(f'shard must be in [0, {num_shards}), got {shard}')
+    rel_paths = [p for p in list_audio_files(root_dir) if shard_of(p, num_shards) == shard]
+    done = load_checkpoint(out_path)
+    todo = [p for p in rel_paths if p not in done]
+    print(f'Shard {shard}/{num_shards}: {len(rel_paths)} files, '
+          f'{len(rel_paths) - len(todo)} already scored, {len(todo)} to go')
+    if not todo:
+        return
+
+    import joblib
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_path)
+    classes = joblib.load(classes_path)
+
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    scored = 0
+    with open(out_path, 'a') as out_file:
+        batch = []
+        for item in iter_features(root_dir, todo, workers, chunksize, n_mels, duration):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                _flush(model, classes, batch, out_file)
+                scored += len(batch)
+                print(f'Scored {scored}/{len(todo)}')
+                batch = []
+        if batch:
+            _flush(model, classes, batch, out_file)
+            scored += len(batch)
+    print(f'Done: wrote {scored} results to {out_path}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', 'models/us8k_cnn.h5'))
+    parser.add_argument('--classes', default=os.environ.get('CLASSES_PATH', 'models/classes.joblib'))
+    parser.add_argument('--shard', type=int, default=0)
+    parser.add_argument('--num_shards', type=int, default=1)
+    parser.add_argument('--batch_size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=32)
+    parser.add_argument('--n_mels', type=int, default=128)
+    parser.add_argument('--duration', type=float, default=4.0)
+    args = parser.parse_args()
+    score_archive(args.root, args.out, model_path=args.model, classes_path=args.classes,
+                  shard=args.shard, num_shards=args.num_shards, batch_size=args.batch_size,
+                  workers=args.workers, chunksize=args.chunksize, n_mels=args.n_mels,
+                  duration=args.duration)
+
+
+if __name__ == '__main__':
+    main()
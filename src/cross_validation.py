@@ -0,0 +1,211 @@
+"""Fold-based cross-validation for UrbanSound8K mel-spectrograms
+
+Each UrbanSound8K fold is held out in turn and the folds are trained
+concurrently in separate processes. Finished folds are written to
+`<out>/fold<N>.json` so an interrupted run resumes where it stopped.
+
+On a machine with GPUs the number of workers is capped at the GPU count and
+each worker enables memory growth, so workers don't each reserve all GPU
+memory up front.
+
+Usage (example):
+python -m src.cross_validation --data data/processed --out models/cv --epochs 10
+"""
+import os
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, classification_report
+
+
+def load_fold_ids(data_dir):
+    folds_path = os.path.join(data_dir, 'folds.npy')
+    if not os.path.exists(folds_path):
+        raise FileNotFoundError(
+            f'{folds_path} not found; re-run src.preprocessing to keep fold ids')
+    return np.load(folds_path)
+
+
+def load_class_names(data_dir):
+    return pd.read_csv(os.path.join(data_dir, 'classes.csv')).iloc[:, 0].astype(str).tolist()
+
+
+def count_gpus():
+    import tensorflow as tf
+    # listing physical devices does not allocate any GPU memory
+    return len(tf.config.list_physical_devices('GPU'))
+
+
+def plan_workers(n_folds, workers=None, gpus=0):
+    """Return (workers, threads_per_worker) so the pool does not oversubscribe the CPUs or GPUs."""
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, n_folds, cpus))
+    if gpus:
+        workers = min(workers, gpus)
+    return workers, max(1, cpus // workers)
+
+
+def inter_op_threads(threads):
+    # at least two so the train step and tf.data function calls can overlap
+    return max(2, threads // 2)
+
+
+def _init_worker(threads):
+    # must run before TensorFlow creates its thread pools in this process
+    inter_op = inter_op_threads(threads)
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    # without this every worker grabs all memory on the GPU and later folds OOM
+    for gpu in tf.config.list_physical_devices('GPU'):
+        tf.config.experimental.set_memory_growth(gpu, True)
+
+
+def run_settings(epochs, batch_size, augment):
+    return {'epochs': int(epochs), 'batch_size': int(batch_size), 'augment': bool(augment)}
+
+
+def fold_result_path(out_dir, fold):
+    return os.path.join(out_dir, f'fold{fold}.json')
+
+
+def run_fold(data_dir, fold, out_dir, epochs=10, batch_size=32, augment=False, threads=None):
+    """Train on every fold except `fold`, evaluate on `fold` and save the result."""
+    from src.model import build_model, make_augment_fn, make_dataset
+
+    # X stays memory-mapped and batches are gathered from it by row index, so
+    # concurrent workers share the page cache instead of each holding a copy
+    X = np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(data_dir, 'y.npy'))
+    folds = load_fold_ids(data_dir)
+    num_classes = len(load_class_names(data_dir))
+
+    train_idx = np.flatnonzero(folds != fold)
+    test_idx = np.flatnonzero(folds == fold)
+    y_test = y[test_idx]
+
+    augment_fn = make_augment_fn(num_classes) if augment else None
+    model = build_model(X.shape[1:], num_classes=num_classes, one_hot_labels=augment)
+    train_ds = make_dataset(X, y, batch_size, indices=train_idx, shuffle=True,
+                            augment_fn=augment_fn, threads=threads)
+    test_ds = make_dataset(X, y, batch_size, indices=test_idx, threads=threads)
+    model.fit(train_ds, epochs=epochs, verbose=2)
+    preds = np.argmax(model.predict(test_ds, verbose=0), axis=1)
+
+    result = {
+        'fold': int(fold),
+        'settings': run_settings(epochs, batch_size, augment),
+        'accuracy': float(accuracy_score(y_test, preds)),
+        'y_true': y_test.tolist(),
+        'y_pred': preds.tolist(),
+    }
+    # write to a temp file first so an interrupted fold is never mistaken for a finished one
+    path = fold_result_path(out_dir, fold)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(result, f)
+    os.replace(tmp_path, path)
+    return result
+
+
+def load_finished(out_dir, folds, settings):
+    """Return saved fold results that were produced with the same `settings`.
+
+    Results from a run with different settings are left out, so those folds
+    are trained again rather than mixed into the summary.
+    """
+    finished = {}
+    for fold in folds:
+        path = fold_result_path(out_dir, fold)
+        if os.path.exists(path):
+            with open(path) as f:
+                result = json.load(f)
+            if result.get('settings') != settings:
+                print(f"Fold {fold}: saved result used {result.get('settings')}, "
+                      f'not {settings}; retraining')
+                continue
+            finished[fold] = result
+    return finished
+
+
+def summarize(results, class_names):
+    """Aggregate per-fold results into mean/std accuracy and a pooled report."""
+    accs = [results[f]['accuracy'] for f in sorted(results)]
+    y_true = np.concatenate([results[f]['y_true'] for f in sorted(results)])
+    y_pred = np.concatenate([results[f]['y_pred'] for f in sorted(results)])
+    labels = list(range(len(class_names)))
+    return {
+        'settings': results[min(results)]['settings'],
+        'folds': {int(f): results[f]['accuracy'] for f in sorted(results)},
+        'mean_accuracy': float(np.mean(accs)),
+        'std_accuracy': float(np.std(accs)),
+        'report': classification_report(y_true, y_pred, labels=labels,
+                                        target_names=class_names, output_dict=True,
+                                        zero_division=0),
+        'report_text': classification_report(y_true, y_pred, labels=labels,
+                                             target_names=class_names, zero_division=0),
+    }
+
+
+def cross_validate(data_dir, out_dir, epochs=10, batch_size=32, workers=None, augment=False):
+    os.makedirs(out_dir, exist_ok=True)
+    all_folds = sorted(int(f) for f in np.unique(load_fold_ids(data_dir)))
+    class_names = load_class_names(data_dir)
+
+    settings = run_settings(epochs, batch_size, augment)
+    results = load_finished(out_dir, all_folds, settings)
+    pending = [f for f in all_folds if f not in results]
+    if results:
+        print('Resuming; already finished folds:', sorted(results))
+
+    if pending:
+        n_workers, threads = plan_workers(len(pending), workers, gpus=count_gpus())
+        print(f'Training {len(pending)} folds with {n_workers} workers x {threads} threads')
+        # spawn keeps TensorFlow state from leaking into children via fork
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = {pool.submit(run_fold, data_dir, f, out_dir, epochs, batch_size, augment,
+                                   threads): f
+                       for f in pending}
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['fold']] = result
+                print(f"Fold {result['fold']} accuracy: {result['accuracy']:.4f}")
+
+    summary = summarize(results, class_names)
+    for fold in sorted(results):
+        print(f'Fold {fold} classification report:')
+        print(classification_report(results[fold]['y_true'], results[fold]['y_pred'],
+                                    labels=list(range(len(class_names))),
+                                    target_names=class_names, zero_division=0))
+    print(f"Mean accuracy: {summary['mean_accuracy']:.4f} +/- {summary['std_accuracy']:.4f}")
+    print('Pooled classification report:')
+    print(summary['report_text'])
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--augment', action='store_true')
+    args = parser.parse_args()
+    cross_validate(args.data, args.out, epochs=args.epochs, batch_size=args.batch_size,
+                   workers=args.workers, augment=args.augment)
+
+
+if __name__ == '__main__':
+    main()
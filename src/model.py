@@ -9,7 +9,7 @@ from sklearn.metrics import classification_report, confusion_matrix
 import joblib
 
 
-def build_model(input_shape, num_classes):
+def build_model(input_shape, num_classes, one_hot_labels=False):
     model = models.Sequential([
         layers.Input(shape=input_shape),
         layers.Reshape((*input_shape, 1)),
@@ -25,21 +25,131 @@ def build_model(input_shape, num_classes):
         layers.Dense(128, activation='relu'),
         layers.Dense(num_classes, activation='softmax')
     ])
-    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    # mixup produces soft targets, which need the dense (one-hot) loss
+    loss = 'categorical_crossentropy' if one_hot_labels else 'sparse_categorical_crossentropy'
+    model.compile(optimizer='adam', loss=loss, metrics=['accuracy'])
     return model
 
 
-def train(data_dir, model_output, epochs=10, batch_size=32, test_size=0.2):
-    X = np.load(os.path.join(data_dir, 'X.npy'))
+def _random_masks(batch, size, count, max_width):
+    """Boolean (batch, size) mask covering `count` random spans of width < max_width."""
+    width = tf.random.uniform((batch, count, 1), 0, max_width, dtype=tf.int32)
+    start = tf.cast(tf.random.uniform((batch, count, 1)) *
+                    tf.cast(size - width + 1, tf.float32), tf.int32)
+    pos = tf.range(size)[tf.newaxis, tf.newaxis, :]
+    return tf.reduce_any((pos >= start) & (pos < start + width), axis=1)
+
+
+def make_augment_fn(num_classes, max_shift=0.1, snr_db=(10.0, 30.0), freq_masks=2,
+                    freq_mask_width=15, time_masks=2, time_mask_width=20, mixup_alpha=0.2):
+    """Return a tf.data map function that augments whole (x, y) batches.
+
+    x is a batch of mel-spectrograms shaped (batch, n_mels, frames). Every op is
+    vectorized over the batch: random circular time shift, additive noise at a
+    random SNR, SpecAugment frequency/time masking and, if `mixup_alpha` > 0,
+    mixup. With mixup the labels come out one-hot, otherwise they stay sparse.
+    """
+    def augment(x, y):
+        batch = tf.shape(x)[0]
+        n_mels, frames = x.shape[1], x.shape[2]
+
+        if max_shift > 0:
+            limit = max(1, int(frames * max_shift))
+            shift = tf.random.uniform((batch, 1), -limit, limit + 1, dtype=tf.int32)
+            idx = (tf.range(frames)[tf.newaxis, :] - shift) % frames
+            x = tf.gather(x, idx, axis=2, batch_dims=1)
+
+        if snr_db is not None:
+            power = tf.reduce_mean(tf.square(x), axis=[1, 2], keepdims=True)
+            snr = tf.random.uniform((batch, 1, 1), snr_db[0], snr_db[1])
+            noise_std = tf.sqrt(power / tf.pow(10.0, snr / 10.0))
+            x = tf.clip_by_value(x + tf.random.normal(tf.shape(x)) * noise_std, 0.0, 1.0)
+
+        if freq_masks > 0:
+            mask = _random_masks(batch, n_mels, freq_masks, freq_mask_width)
+            x = tf.where(mask[:, :, tf.newaxis], 0.0, x)
+        if time_masks > 0:
+            mask = _random_masks(batch, frames, time_masks, time_mask_width)
+            x = tf.where(mask[:, tf.newaxis, :], 0.0, x)
+
+        if mixup_alpha > 0:
+            y = tf.one_hot(y, num_classes)
+            # Beta(a, a) sample from two Gamma(a) draws
+            g1 = tf.random.gamma((batch,), mixup_alpha)
+            g2 = tf.random.gamma((batch,), mixup_alpha)
+            lam = g1 / (g1 + g2 + 1e-8)
+            perm = tf.random.shuffle(tf.range(batch))
+            x = lam[:, tf.newaxis, tf.newaxis] * x + \
+                (1 - lam[:, tf.newaxis, tf.newaxis]) * tf.gather(x, perm)
+            y = lam[:, tf.newaxis] * y + (1 - lam[:, tf.newaxis]) * tf.gather(y, perm)
+        return x, y
+
+    return augment
+
+
+def make_dataset(X, y, batch_size, indices=None, shuffle=False, augment_fn=None,
+                 one_hot_classes=None, threads=None):
+    """Build a batched, prefetched tf.data pipeline over the rows `indices` of X/y.
+
+    X may be a numpy array or a read-only memmap; only index batches flow
+    through tf.data and each batch is gathered from X on demand, so no second
+    copy of the training set is made. Augmentation runs once per batch in
+    parallel with training. `threads` caps tf.data's own thread pool, which
+    otherwise sizes AUTOTUNE work from every CPU on the machine.
+    """
+    if indices is None:
+        indices = np.arange(len(y))
+    indices = np.asarray(indices, dtype=np.int64)
+    x_shape = tuple(X.shape[1:])
+    y_dtype = tf.as_dtype(y.dtype)
+
+    def gather(idx):
+        return np.asarray(X[idx], dtype=np.float32), y[idx]
+
+    def load_batch(idx):
+        xb, yb = tf.numpy_function(gather, [idx], (tf.float32, y_dtype))
+        xb.set_shape((None,) + x_shape)
+        yb.set_shape((None,))
+        return xb, yb
+
+    ds = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        ds = ds.shuffle(len(indices), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(load_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    if augment_fn is not None:
+        ds = ds.map(augment_fn, num_parallel_calls=tf.data.AUTOTUNE)
+    elif one_hot_classes is not None:
+        ds = ds.map(lambda xb, yb: (xb, tf.one_hot(yb, one_hot_classes)),
+                    num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.prefetch(tf.data.AUTOTUNE)
+    if threads is not None:
+        options = tf.data.Options()
+        options.threading.private_threadpool_size = threads
+        options.threading.max_intra_op_parallelism = 1
+        ds = ds.with_options(options)
+    return ds
+
+
+def train(data_dir, model_output, epochs=10, batch_size=32, test_size=0.2, augment=False):
+    # memory-map X; batches are read from it by index instead of splitting copies
+    X = np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r')
     y = np.load(os.path.join(data_dir, 'y.npy'))
     classes = list(np.loadtxt(os.path.join(data_dir, 'classes.csv'), dtype=str, delimiter='\n'))
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=test_size, random_state=42, stratify=y)
+    train_idx, val_idx = train_test_split(np.arange(len(y)), test_size=test_size, random_state=42, stratify=y)
+    # sorted rows read the memmap sequentially and keep predictions aligned with y_val
+    val_idx = np.sort(val_idx)
+    y_val = y[val_idx]
 
-    input_shape = X_train.shape[1:]
-    model = build_model(input_shape, num_classes=len(classes))
-    model.fit(X_train, y_train, validation_data=(X_val, y_val), epochs=epochs, batch_size=batch_size)
+    input_shape = X.shape[1:]
+    num_classes = len(classes)
+    augment_fn = make_augment_fn(num_classes) if augment else None
+    model = build_model(input_shape, num_classes=num_classes, one_hot_labels=augment)
+    train_ds = make_dataset(X, y, batch_size, indices=train_idx, shuffle=True, augment_fn=augment_fn)
+    val_ds = make_dataset(X, y, batch_size, indices=val_idx,
+                          one_hot_classes=num_classes if augment else None)
+    model.fit(train_ds, validation_data=val_ds, epochs=epochs)
     # evaluate
-    preds = np.argmax(model.predict(X_val), axis=1)
+    preds = np.argmax(model.predict(val_ds), axis=1)
     print(classification_report(y_val, preds))
     print('Confusion matrix:')
     print(confusion_matrix(y_val, preds))
@@ -56,9 +166,11 @@ def main():
     parser.add_argument('--model_output', required=True)
     parser.add_argument('--train', action='store_true')
     parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--augment', action='store_true',
+                        help='apply on-the-fly augmentation (shift, noise, SpecAugment, mixup)')
     args = parser.parse_args()
     if args.train:
-        train(args.data, args.model_output, epochs=args.epochs)
+        train(args.data, args.model_output, epochs=args.epochs, augment=args.augment)
 
 
 if __name__ == '__main__':
@@ -1,19 +1,78 @@
 """FastAPI prediction server for audio uploads"""
 import os
-import io
 import numpy as np
 from fastapi import FastAPI, File, UploadFile, BackgroundTasks
 from fastapi.responses import JSONResponse
 import uvicorn
+from starlette.concurrency import run_in_threadpool
 import librosa
+import soundfile as sf
 import tensorflow as tf
 import joblib
 from threading import Thread
 
 MODEL_PATH = os.environ.get('MODEL_PATH', 'models/us8k_cnn.h5')
 CLASSES_PATH = os.environ.get('CLASSES_PATH', 'models/classes.joblib')
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+AUDIO_DURATION = float(os.environ.get('AUDIO_DURATION', '4.0'))
+HEADER_BYTES = 12
+
+
+class MaxBodySizeMiddleware:
+    """Reject request bodies larger than `max_bytes` with 413 while they stream in.
+
+    A too-large Content-Length is refused before any of the body is read;
+    bodies without one (chunked) are counted as they arrive and cut off as
+    soon as they cross the limit.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send):
+        body = b'{"error":"Upload too large"}'
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get('headers') or [])
+        length = headers.get(b'content-length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            return await self._reject(send)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    rejected = True
+                    await self._reject(send)
+                    # the app sees a disconnect and stops parsing the body
+                    return {'type': 'http.disconnect'}
+            return message
+
+        async def guarded_send(message):
+            # drop whatever the app tries to answer after we already sent 413
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
 
 app = FastAPI()
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=MAX_UPLOAD_BYTES)
 model = None
 classes = None
 
@@ -38,7 +97,8 @@ def root():
         'endpoints': {
             'GET /': 'API information',
             'GET /health': 'Health check',
-            'POST /predict': 'Predict audio class (upload .wav file)',
+            'POST /predict': 'Predict audio class (upload WAV, FLAC, OGG or AIFF; '
+                             '413 if over the size limit, 415 if not a supported format)',
             'POST /retrain': 'Trigger model retraining'
         },
         'model_loaded': model is not None,
@@ -46,31 +106,68 @@ def root():
     }
 
 
-def prepare_mel_from_bytes(file_bytes, sr=22050, n_mels=128, duration=4.0):
-    data, sr = librosa.load(io.BytesIO(file_bytes), sr=sr, mono=True, duration=duration)
+def sniff_audio_format(header):
+    """Return the container format from the first bytes of a file, or None if unsupported."""
+    if header[:4] in (b'RIFF', b'RF64') and header[8:12] == b'WAVE':
+        return 'WAV'
+    if header[:4] == b'fLaC':
+        return 'FLAC'
+    if header[:4] == b'OggS':
+        return 'OGG'
+    if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+        return 'AIFF'
+    return None
+
+
+def mel_from_waveform(data, sr=22050, n_mels=128, duration=4.0):
     target_length = int(sr * duration)
     if data.shape[0] < target_length:
         data = np.pad(data, (0, target_length - data.shape[0]))
     else:
         data = data[:target_length]
-    mel = librosa.feature.melspectrogram(data, sr=sr, n_mels=n_mels)
+    mel = librosa.feature.melspectrogram(y=data, sr=sr, n_mels=n_mels)
     mel_db = librosa.power_to_db(mel, ref=np.max)
     mel_norm = (mel_db - mel_db.min()) / (mel_db.max() - mel_db.min() + 1e-6)
     return mel_norm.astype(np.float32)
 
 
+def prepare_mel_from_file(fileobj, sr=22050, n_mels=128, duration=4.0):
+    """Decode only the first `duration` seconds of a seekable audio file object."""
+    with sf.SoundFile(fileobj) as snd:
+        native_sr = snd.samplerate
+        data = snd.read(int(native_sr * duration), dtype='float32', always_2d=True)
+    data = data.mean(axis=1)
+    if native_sr != sr:
+        data = librosa.resample(data, orig_sr=native_sr, target_sr=sr)
+    return mel_from_waveform(data, sr=sr, n_mels=n_mels, duration=duration)
+
+
+def predict_file(fileobj, duration=AUDIO_DURATION):
+    mel = prepare_mel_from_file(fileobj, duration=duration)
+    x = np.expand_dims(mel, axis=0)
+    # direct call rather than model.predict: no per-call setup and safe from worker threads
+    return model(x, training=False).numpy()
+
+
 @app.post('/predict')
 async def predict(file: UploadFile = File(...)):
     global model, classes
     if model is None or classes is None:
         return JSONResponse({'error': 'Model not loaded'}, status_code=500)
-    body = await file.read()
+    # the body is already size-capped by MaxBodySizeMiddleware and spooled to
+    # disk by the multipart parser, so only the header is pulled into memory here
+    header = await file.read(HEADER_BYTES)
+    if sniff_audio_format(header) is None:
+        return JSONResponse({'error': 'Unsupported or non-audio file; expected WAV, FLAC, OGG or AIFF'},
+                            status_code=415)
+    await file.seek(0)
     try:
-        mel = prepare_mel_from_bytes(body)
-        x = np.expand_dims(mel, axis=0)
-        preds = model.predict(x)
+        # decoding and inference both run off the event loop
+        preds = await run_in_threadpool(predict_file, file.file)
         idx = int(np.argmax(preds, axis=1)[0])
         return {'prediction': classes[idx], 'probs': preds.tolist()[0]}
+    except sf.SoundFileError as e:
+        return JSONResponse({'error': f'Could not decode audio: {e}'}, status_code=400)
     except Exception as e:
         return JSONResponse({'error': str(e)}, status_code=500)
 
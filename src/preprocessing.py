@@ -109,7 +109,7 @@ def extract_mel(wav_path, sr=22050, n_mels=128, duration=4.0):
         y = np.pad(y, (0, target_length - y.shape[0]))
     else:
         y = y[:target_length]
-    mel = librosa.feature.melspectrogram(y, sr=sr, n_mels=n_mels)
+    mel = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=n_mels)
     mel_db = librosa.power_to_db(mel, ref=np.max)
     # normalize to 0-1
     mel_norm = (mel_db - mel_db.min()) / (mel_db.max() - mel_db.min() + 1e-6)
@@ -130,6 +130,7 @@ def process_urbansound8k(source_dir, out_dir, n_mels=128, duration=4.0):
     meta = pd.read_csv(meta_path)
     X = []
     y = []
+    folds = []
     classes = sorted(meta['class'].unique())
     class_to_idx = {c: i for i, c in enumerate(classes)}
 
@@ -146,14 +147,18 @@ def process_urbansound8k(source_dir, out_dir, n_mels=128, duration=4.0):
             mel = extract_mel(audio_path, n_mels=n_mels, duration=duration)
             X.append(mel)
             y.append(class_to_idx[cls])
+            folds.append(int(fold))
         except Exception:
             continue
 
     X = np.array(X)
     y = np.array(y)
+    folds = np.array(folds, dtype=np.int8)
     print('Processed', X.shape, y.shape)
     np.save(os.path.join(out_dir, 'X.npy'), X)
     np.save(os.path.join(out_dir, 'y.npy'), y)
+    # keep the UrbanSound8K fold of every row so evaluation can respect folds
+    np.save(os.path.join(out_dir, 'folds.npy'), folds)
     # save classes
     pd.Series(classes).to_csv(os.path.join(out_dir, 'classes.csv'), index=False)
 